@@ -5,19 +5,40 @@
 import math
 import os
 from random import randint
-from collections import deque
 
+import numpy as np
 import pygame
 from pygame.locals import *
+from pygame._sdl2.video import Window, Renderer, Texture
+
+try:
+    from numba import njit
+except ImportError:
+    # numba не обязательна: без неё ядра работают как обычный Python
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+
+        def decorator(func):
+            return func
+        return decorator
 
 
 FPS = 60
+MSEC_PER_FRAME = 1000.0 / FPS   # frames_to_msec(1), FPS фиксирован
 ANIMATION_SPEED = 0.18  # пикселей в миллисекунду
 WIN_WIDTH = 284 * 2     # Размер изображения BG: 284x512 пикселей
 WIN_HEIGHT = 512
 
 
-class Bird(pygame.sprite.Sprite):
+def _surface_mask_np(surface):
+    """Вернуть битовую маску поверхности как массив NumPy bool,
+    индексируемый [x, y]. Как и pygame.mask.from_surface, пиксель
+    считается непрозрачным только при альфе больше 127."""
+    return pygame.surfarray.array_alpha(surface) > 127
+
+
+class Bird:
     """Птица - «герой» этой игры. Игрок может заставить её подняться
     (быстро поднимается), иначе опуститься (спускается медленнее). Это должно
     проходить через пространство между трубами (на каждую пройденную трубу
@@ -38,6 +59,9 @@ class Bird(pygame.sprite.Sprite):
         выполнить полный набор высоты.
     """
 
+    __slots__ = ('x', 'y', 'msec_to_climb', '_img_wingup', '_img_wingdown',
+                 '_mask_np_wingup', '_mask_np_wingdown', 'image', 'mask_np')
+
     WIDTH = HEIGHT = 32
     SINK_SPEED = 0.18
     CLIMB_SPEED = 0.3
@@ -54,53 +78,75 @@ class Bird(pygame.sprite.Sprite):
                 0. изображение птицы с направленным вверх крылом.
                 1. изображение птицы с направленным вниз крылом.
         """
-        super(Bird, self).__init__()
         self.x, self.y = x, y
         self.msec_to_climb = msec_to_climb
         self._img_wingup, self._img_wingdown = images
-        self._mask_wingup = pygame.mask.from_surface(self._img_wingup)
-        self._mask_wingdown = pygame.mask.from_surface(self._img_wingdown)
+        # битовые маски как массивы NumPy [x, y] для векторного сравнения
+        self._mask_np_wingup = _surface_mask_np(self._img_wingup)
+        self._mask_np_wingdown = _surface_mask_np(self._img_wingdown)
+        self.image = self._img_wingup
+        self.mask_np = self._mask_np_wingup
 
     def update(self, delta_frames=1):
-        if self.msec_to_climb > 0:
-            frac_climb_done = 1 - self.msec_to_climb/Bird.CLIMB_DURATION
-            self.y -= (Bird.CLIMB_SPEED * frames_to_msec(delta_frames) *
-                       (1 - math.cos(frac_climb_done * math.pi)))
-            self.msec_to_climb -= frames_to_msec(delta_frames)
-        else:
-            self.y += Bird.SINK_SPEED * frames_to_msec(delta_frames)
+        self.y, self.msec_to_climb = _bird_update(
+            self.y, self.msec_to_climb, delta_frames * MSEC_PER_FRAME)
 
-    @property
-    def image(self):
+    def step(self, ticks):
+        """Выбрать изображение и маску для текущего кадра.
+        Крыло направлено вверх или вниз в зависимости от переданного
+        значения pygame.time.get_ticks(), считанного один раз за кадр.
         """
-        Это решит, возвращать ли изображение, на котором
-        видимое крыло направлено вверх или вниз
-        на основе pygame.time.get_ticks ().
-        """
-        if pygame.time.get_ticks() % 500 >= 250:
-            return self._img_wingup
+        if ticks % 500 >= 250:
+            self.image = self._img_wingup
+            self.mask_np = self._mask_np_wingup
         else:
-            return self._img_wingdown
+            self.image = self._img_wingdown
+            self.mask_np = self._mask_np_wingdown
 
-    @property
-    def mask(self):
-        if pygame.time.get_ticks() % 500 >= 250:
-            return self._mask_wingup
-        else:
-            return self._mask_wingdown
 
-    @property
-    def rect(self):
-        return Rect(self.x, self.y, Bird.WIDTH, Bird.HEIGHT)
+# копии констант класса для JIT-ядер: numba в режиме nopython видит
+# только простые глобальные значения, не атрибуты классов
+_CLIMB_DURATION = Bird.CLIMB_DURATION
+_CLIMB_SPEED = Bird.CLIMB_SPEED
+_SINK_SPEED = Bird.SINK_SPEED
+
+# таблица кривой набора высоты 1 - cos(t*pi): за подъём встречается лишь
+# пара десятков значений t, так что чтение из таблицы заменяет вызов cos
+_CLIMB_CURVE = np.array([1.0 - math.cos(i / 63 * math.pi)
+                         for i in range(64)])
+
 
+@njit(cache=True, fastmath=True)
+def _bird_update(y, msec_to_climb, dt):
+    """Численный шаг птицы за dt миллисекунд.
+    Возвращает новые (y, msec_to_climb)."""
+    if msec_to_climb > 0:
+        frac_climb_done = 1.0 - msec_to_climb / _CLIMB_DURATION
+        y -= _CLIMB_SPEED * dt * _CLIMB_CURVE[int(frac_climb_done * 63)]
+        msec_to_climb -= dt
+    else:
+        y += _SINK_SPEED * dt
+    return y, msec_to_climb
 
-class PipePair(pygame.sprite.Sprite):
+
+@njit(cache=True, fastmath=True)
+def _pipe_update(x, dt):
+    """Численный шаг трубы за dt миллисекунд; возвращает новый x."""
+    return x - ANIMATION_SPEED * dt
+
+
+# готовые маски и раскладки кусков труб, ключ - (top_pieces,
+# bottom_pieces); возможных комбинаций мало, поэтому каждая форма
+# строится лишь один раз
+_PIPE_CACHE = {}
+
+
+class PipePair:
     """Обозначает препятствие.
     PipePair имеет верхнюю и нижнюю трубы, и только между ними можно
     Птица проходит - если она сталкивается с какой-либо частью, игра окончена.
-    Атрибуты:
-    image: pygame.Surface, который может быть перенесен на поверхность дисплея
-        для отображения PipePair.
+    Куски труб рисуются методом draw() прямо в позиции пары, без
+    промежуточной поверхности на всю высоту окна.
     Константы:
     WIDTH: ширина участка трубы в пикселях. Потому что труба
         шириной всего один кусок, это также ширина PipePair's
@@ -109,6 +155,9 @@ class PipePair(pygame.sprite.Sprite):
     ADD_INTERVAL: интервал в миллисекундах между добавлением новых
         трубы."""
 
+    __slots__ = ('x', 'bottom_pieces', 'top_pieces', 'mask_np',
+                 '_body_ys', '_end_ys')
+
     WIDTH = 80
     PIECE_HEIGHT = 32
     ADD_INTERVAL = 3000
@@ -122,11 +171,7 @@ class PipePair(pygame.sprite.Sprite):
             тела трубы.
         """
         self.x = float(WIN_WIDTH - 1)
-        self.score_counted = False
 
-        self.image = pygame.Surface((PipePair.WIDTH, WIN_HEIGHT), SRCALPHA)
-        self.image.convert()   # ускоряет копирование
-        self.image.fill((0, 0, 0, 0))
         total_pipe_body_pieces = int(
             (WIN_HEIGHT -                  # заполнить окно сверху вниз
              3 * Bird.HEIGHT -             # освободить место для птицы
@@ -136,26 +181,46 @@ class PipePair(pygame.sprite.Sprite):
         self.bottom_pieces = randint(1, total_pipe_body_pieces)
         self.top_pieces = total_pipe_body_pieces - self.bottom_pieces
 
-        # нижняя труба
-        for i in range(1, self.bottom_pieces + 1):
-            piece_pos = (0, WIN_HEIGHT - i*PipePair.PIECE_HEIGHT)
-            self.image.blit(pipe_body_img, piece_pos)
-        bottom_pipe_end_y = WIN_HEIGHT - self.bottom_height_px
-        bottom_end_piece_pos = (0, bottom_pipe_end_y - PipePair.PIECE_HEIGHT)
-        self.image.blit(pipe_end_img, bottom_end_piece_pos)
-
-        # верхняя труба
-        for i in range(self.top_pieces):
-            self.image.blit(pipe_body_img, (0, i * PipePair.PIECE_HEIGHT))
-        top_pipe_end_y = self.top_height_px
-        self.image.blit(pipe_end_img, (0, top_pipe_end_y))
+        # одинаковые конфигурации разделяют одну маску и раскладку
+        key = (self.top_pieces, self.bottom_pieces)
+        if key not in _PIPE_CACHE:
+            _PIPE_CACHE[key] = PipePair._build(
+                self.top_pieces, self.bottom_pieces,
+                pipe_end_img, pipe_body_img)
+        self.mask_np, self._body_ys, self._end_ys = _PIPE_CACHE[key]
 
         # компенсировать добавленные концевые детали
         self.top_pieces += 1
         self.bottom_pieces += 1
 
-        # для обнаружения столкновений
-        self.mask = pygame.mask.from_surface(self.image)
+    @classmethod
+    def _build(cls, top_pieces, bottom_pieces, pipe_end_img, pipe_body_img):
+        """Вычислить маску и раскладку кусков для конфигурации труб.
+        Возвращает (mask_np, body_ys, end_ys), где body_ys и end_ys -
+        кортежи координат Y кусков тела и концевых частей.
+        Аргументы:
+        top_pieces: количество элементов корпуса верхней трубы.
+        bottom_pieces: количество элементов корпуса нижней трубы.
+        pipe_end_img: изображение концевой части трубы.
+        pipe_body_img: изображение одного среза тела трубы.
+        """
+        body_ys = tuple(
+            # нижняя труба
+            [WIN_HEIGHT - i*cls.PIECE_HEIGHT
+             for i in range(1, bottom_pieces + 1)] +
+            # верхняя труба
+            [i * cls.PIECE_HEIGHT for i in range(top_pieces)])
+        end_ys = (WIN_HEIGHT - (bottom_pieces + 1) * cls.PIECE_HEIGHT,
+                  top_pieces * cls.PIECE_HEIGHT)
+
+        # временная поверхность нужна только для построения маски
+        image = pygame.Surface((cls.WIDTH, WIN_HEIGHT), SRCALPHA)
+        image.fill((0, 0, 0, 0))
+        for y in body_ys:
+            image.blit(pipe_body_img, (0, y))
+        for y in end_ys:
+            image.blit(pipe_end_img, (0, y))
+        return _surface_mask_np(image), body_ys, end_ys
 
     @property
     def top_height_px(self):
@@ -171,15 +236,41 @@ class PipePair(pygame.sprite.Sprite):
     def visible(self):
         return -PipePair.WIDTH < self.x < WIN_WIDTH
 
-    @property
-    def rect(self):
-        return Rect(self.x, 0, PipePair.WIDTH, PipePair.PIECE_HEIGHT)
-
     def update(self, delta_frames=1):
-        self.x -= ANIMATION_SPEED * frames_to_msec(delta_frames)
+        self.x = _pipe_update(self.x, delta_frames * MSEC_PER_FRAME)
+
+    def draw(self, body_tex, end_tex):
+        """Нарисовать куски пары труб в её текущей позиции.
+        Аргументы:
+        body_tex: текстура одного среза тела трубы.
+        end_tex: текстура концевой части трубы.
+        """
+        x = self.x
+        for y in self._body_ys:
+            body_tex.draw(
+                dstrect=(x, y, PipePair.WIDTH, PipePair.PIECE_HEIGHT))
+        for y in self._end_ys:
+            end_tex.draw(
+                dstrect=(x, y, PipePair.WIDTH, PipePair.PIECE_HEIGHT))
 
     def collides_with(self, bird):
-        return pygame.sprite.collide_mask(self, bird)
+        # дешёвая проверка по оси X перед дорогим сравнением масок
+        if bird.x + Bird.WIDTH < self.x or bird.x > self.x + PipePair.WIDTH:
+            return False
+        # векторное И масок в окне пересечения прямоугольников
+        sx, bx, by = int(self.x), int(bird.x), int(bird.y)
+        x0 = max(sx, bx)
+        x1 = min(sx + PipePair.WIDTH, bx + Bird.WIDTH)
+        y0 = max(0, by)
+        y1 = min(WIN_HEIGHT, by + Bird.HEIGHT)
+        if x0 >= x1 or y0 >= y1:
+            return False
+        return bool(np.any(self.mask_np[x0 - sx:x1 - sx, y0:y1] &
+                           bird.mask_np[x0 - bx:x1 - bx, y0 - by:y1 - by]))
+
+
+# количество кадров между появлением новых труб при фиксированном FPS
+FRAMES_PER_ADD_INTERVAL = int(FPS * PipePair.ADD_INTERVAL / 1000.0)
 
 
 def load_images():
@@ -187,25 +278,35 @@ def load_images():
     def load_image(img_file_name):
         """Вернуть загруженное изображение pygame с указанным именем файла.
         Эта функция ищет изображения в папке изображений игры.
-        (dirname (__ file __) / images /). Все изображения конвертируются перед тем, как быть
-        вернулся, чтобы ускорить блиттинг.
+        (dirname (__ file __) / images /). Поверхности возвращаются без
+        convert()/convert_alpha(): при аппаратном рендере нет дисплейной
+        поверхности, задающей формат конвертации, а поверхности здесь
+        лишь источники для Texture.from_surface и построения масок -
+        ни тому, ни другому конвертация не нужна.
         Аргументы:
         img_file_name: имя файла (включая его расширение, например
             '.png') требуемого изображения без указания пути к файлу.
         """
         file_name = os.path.join(os.path.dirname(__file__),
                                  'images', img_file_name)
-        img = pygame.image.load(file_name)
-        img.convert()
-        return img
+        return pygame.image.load(file_name)
+
+    images = {'background': load_image('background.png'),
+              'pipe-end': load_image('pipe_end.png'),
+              'pipe-body': load_image('pipe_body.png'),
+              # изображения для анимации машущей птицы - анимированные GIF-файлы
+              # не поддерживается в pygame
+              'bird-wingup': load_image('bird_wing_up.png'),
+              'bird-wingdown': load_image('bird_wing_down.png')}
 
-    return {'background': load_image('background.png'),
-            'pipe-end': load_image('pipe_end.png'),
-            'pipe-body': load_image('pipe_body.png'),
-            # изображения для анимации машущей птицы - анимированные GIF-файлы
-            # не поддерживается в pygame
-            'bird-wingup': load_image('bird_wing_up.png'),
-            'bird-wingdown': load_image('bird_wing_down.png')}
+    # фон склеивается один раз в поверхность на всю ширину окна,
+    # из которой затем создаётся единственная текстура
+    background_full = pygame.Surface((WIN_WIDTH, WIN_HEIGHT))
+    background_full.blit(images['background'], (0, 0))
+    background_full.blit(images['background'], (int(WIN_WIDTH / 2), 0))
+    images['background_full'] = background_full
+
+    return images
 
 
 def frames_to_msec(frames, fps=FPS):
@@ -230,8 +331,13 @@ def main():
  
     pygame.init()
 
-    display_surface = pygame.display.set_mode((WIN_WIDTH, WIN_HEIGHT))
-    pygame.display.set_caption('Pygame Flappy Bird')
+    # аппаратный рендер SDL2: копирование пикселей выполняет GPU,
+    # а не программный блиттер SDL на CPU
+    # vsync выключен: темп кадров задаёт clock.tick(FPS), а физика
+    # считается фиксированным шагом на кадр - ограничение present()
+    # частотой дисплея замедлило бы игру на экранах медленнее 60 Гц
+    window = Window('Pygame Flappy Bird', size=(WIN_WIDTH, WIN_HEIGHT))
+    renderer = Renderer(window, vsync=False)
 
     clock = pygame.time.Clock()
     score_font = pygame.font.SysFont(None, 32, bold=True)  # шрифт по умолчанию
@@ -242,19 +348,65 @@ def main():
     bird = Bird(50, int(WIN_HEIGHT/2 - Bird.HEIGHT/2), 2,
                 (images['bird-wingup'], images['bird-wingdown']))
 
-    pipes = deque()
+    # поверхности загружаются в текстуры GPU один раз; кэш хранит
+    # текстуру для каждой уже встречавшейся поверхности
+    texture_cache = {}
+
+    def surf_texture(surf):
+        """Вернуть текстуру GPU для поверхности (с кэшированием)."""
+        tex = texture_cache.get(surf)
+        if tex is None:
+            tex = Texture.from_surface(renderer, surf)
+            texture_cache[surf] = tex
+        return tex
+
+    # живых труб одновременно не больше ~5, так что обычный список
+    # с pop(0) дешевле deque и даёт непрерывную итерацию и индексацию
+    pipes = []
 
     frame_clock = 0  # этот счетчик увеличивается, если игра не поставлена ​​на паузу
     score = 0
+    score_cache = {}  # отрисованные цифры счёта, ключ - значение счёта
+    next_score_idx = 0  # индекс передней ещё не засчитанной трубы
+    next_spawn_frame = 0  # кадр, на котором появится следующая труба
+
+    # привязать горячие имена к локальным переменным: поиск в словарях
+    # модуля/класса/объекта выполняется один раз, а не каждый кадр
+    tick = clock.tick
+    event_get = pygame.event.get
+    get_ticks = pygame.time.get_ticks
+    present = renderer.present
+    background_tex = surf_texture(images['background_full'])
+    pipe_body_tex = surf_texture(images['pipe-body'])
+    pipe_end_tex = surf_texture(images['pipe-end'])
+    bird_x = bird.x
+    bird_width = Bird.WIDTH
+    bird_height = Bird.HEIGHT
+    pipe_width = PipePair.WIDTH
+    score_y = PipePair.PIECE_HEIGHT
+    half_win_width = WIN_WIDTH / 2
+
     done = paused = False
     while not done:
-        clock.tick(FPS)
+        if paused:
+            # на паузе не крутить цикл на 60 Гц: заблокироваться на
+            # ожидании события и отдать CPU целиком
+            e = pygame.event.wait()
+            if e.type == QUIT or (e.type == KEYUP and e.key == K_ESCAPE):
+                done = True
+            elif e.type == KEYUP and e.key in (K_PAUSE, K_p):
+                paused = False
+            continue
 
-        if not (paused or frame_clock % msec_to_frames(PipePair.ADD_INTERVAL)):
+        tick(FPS)
+
+        # целочисленное сравнение вместо деления с остатком каждый кадр
+        if frame_clock >= next_spawn_frame:
             pp = PipePair(images['pipe-end'], images['pipe-body'])
             pipes.append(pp)
+            next_spawn_frame += FRAMES_PER_ADD_INTERVAL
 
-        for e in pygame.event.get():
+        for e in event_get():
             if e.type == QUIT or (e.type == KEYUP and e.key == K_ESCAPE):
                 done = True
                 break
@@ -266,35 +418,57 @@ def main():
 
         if paused:
             continue
-        # проверка на столкновения
-        pipe_collision = any(p.collides_with(bird) for p in pipes)
-        if pipe_collision or 0 >= bird.y or bird.y >= WIN_HEIGHT - Bird.HEIGHT:
+
+        # один вызов get_ticks на кадр вместо обращения в каждом свойстве
+        bird.step(get_ticks())
+        # проверка на столкновения; трубы упорядочены слева направо,
+        # поэтому после первой трубы правее птицы можно остановиться
+        pipe_collision = False
+        for p in pipes:
+            if p.x > bird_x + bird_width:
+                break
+            if p.collides_with(bird):
+                pipe_collision = True
+                break
+        if pipe_collision or 0 >= bird.y or bird.y >= WIN_HEIGHT - bird_height:
             done = True
 
-        for x in (0, WIN_WIDTH / 2):
-            display_surface.blit(images['background'], (x, 0))
+        background_tex.draw()   # фон заполняет всю цель рендера
 
         while pipes and not pipes[0].visible:
-            pipes.popleft()
+            pipes.pop(0)
+            if next_score_idx:
+                next_score_idx -= 1
 
         for p in pipes:
             p.update()
-            display_surface.blit(p.image, p.rect)
+            p.draw(pipe_body_tex, pipe_end_tex)
 
         bird.update()
-        display_surface.blit(bird.image, bird.rect)
-
-        # обновить и отобразить счет
-        for p in pipes:
-            if p.x + PipePair.WIDTH < bird.x and not p.score_counted:
+        surf_texture(bird.image).draw(
+            dstrect=(bird_x, int(bird.y), bird_width, bird_height))
+
+        # обновить и отобразить счет; трубы движутся монотонно,
+        # поэтому пересечь птицу может только передняя незасчитанная
+        if next_score_idx < len(pipes):
+            p = pipes[next_score_idx]
+            if p.x + pipe_width < bird_x:
                 score += 1
-                p.score_counted = True
-
-        score_surface = score_font.render(str(score), True, (255, 255, 255))
-        score_x = WIN_WIDTH/2 - score_surface.get_width()/2
-        display_surface.blit(score_surface, (score_x, PipePair.PIECE_HEIGHT))
-
-        pygame.display.flip()
+                next_score_idx += 1
+
+        # счёт меняется раз в несколько секунд - растеризовать его
+        # заново каждый кадр незачем
+        score_surface = score_cache.get(score)
+        if score_surface is None:
+            score_surface = score_font.render(str(score), True,
+                                              (255, 255, 255))
+            score_cache[score] = score_surface
+        score_tex = surf_texture(score_surface)
+        score_x = half_win_width - score_tex.width/2
+        score_tex.draw(
+            dstrect=(score_x, score_y, score_tex.width, score_tex.height))
+
+        present()
         frame_clock += 1
     print('Game over! Score: %i' % score)
     pygame.quit()